@@ -2,7 +2,7 @@
 
 import argparse
 from utils.colors import print_colored, Colors
-from core.processor import update_csv_with_trailers
+from core.processor import update_csv_with_trailers, CHECKPOINT_MIN_SECONDS, DEFAULT_CHECKPOINT_INTERVAL
 
 
 def create_parser() -> argparse.ArgumentParser:
@@ -14,9 +14,11 @@ def create_parser() -> argparse.ArgumentParser:
 Examples:
   %(prog)s movies.csv                    # Process movies.csv with default settings
   %(prog)s data.csv --verbose            # Show detailed progress
-  %(prog)s films.csv --delay 1.0         # Faster processing (1 second delay)
+  %(prog)s films.csv --delay 1.0         # Shorter backoff when rate limited
+  %(prog)s large.csv --concurrency 10    # Search 10 movies in parallel
   %(prog)s movies.csv --dry-run          # Preview what would be processed
   %(prog)s data.csv --force              # Skip confirmation prompts
+  %(prog)s movies.csv --no-cache         # Search again instead of using cached results
 
 The tool automatically detects:
   - CSV delimiter (comma, semicolon, etc.)
@@ -27,6 +29,7 @@ Features:
   - YouTube trailer search
   - TMDb integration for director's popular films
   - Only processes missing data (won't overwrite existing content)
+  - Caches search results for 24 hours so reruns are near-instant
         """
     )
     
@@ -39,7 +42,21 @@ Features:
         '--delay', '-d',
         type=float,
         default=2.0,
-        help='Delay between YouTube searches in seconds (default: 2.0)'
+        help='Base pause in seconds after a rate-limited response (default: 2.0)'
+    )
+    
+    parser.add_argument(
+        '--concurrency', '-c',
+        type=int,
+        default=5,
+        help='Initial number of movies searched in parallel; adapts to API responses (default: 5)'
+    )
+    
+    parser.add_argument(
+        '--max-rpm',
+        type=int,
+        default=0,
+        help='Maximum requests per minute across both APIs (default: unlimited)'
     )
     
     parser.add_argument(
@@ -66,6 +83,27 @@ Features:
         help='Skip adding related films from TMDb'
     )
     
+    parser.add_argument(
+        '--checkpoint-interval',
+        type=int,
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        metavar='ROWS',
+        help=f'Save progress to the file every ROWS filled-in rows, at most once every '
+             f'{CHECKPOINT_MIN_SECONDS:g}s, 0 to disable (default: {DEFAULT_CHECKPOINT_INTERVAL})'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Ignore cached search results and do not store new ones'
+    )
+    
+    parser.add_argument(
+        '--cache-file',
+        metavar='PATH',
+        help='Location of the search cache (default: ~/.cache/movie-trailer-finder/cache.db)'
+    )
+    
     parser.add_argument(
         '--version',
         action='version',
@@ -84,11 +122,26 @@ def main():
     if args.delay < 0.1:
         print_colored("⚠️  Warning: Very short delay may cause rate limiting", Colors.YELLOW)
     
+    if args.max_rpm < 0:
+        parser.error("--max-rpm cannot be negative")
+    
+    if args.checkpoint_interval < 0:
+        parser.error("--checkpoint-interval cannot be negative")
+    
+    # Validate concurrency
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    
     update_csv_with_trailers(
         input_file=args.file,
         delay=args.delay,
         verbose=args.verbose,
         dry_run=args.dry_run,
         force=args.force,
-        include_related=not args.no_related
+        include_related=not args.no_related,
+        concurrency=args.concurrency,
+        max_rpm=args.max_rpm,
+        use_cache=not args.no_cache,
+        cache_file=args.cache_file,
+        checkpoint_interval=args.checkpoint_interval
     )
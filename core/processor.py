@@ -1,18 +1,309 @@
 """Main processing logic for updating CSV files with trailer links."""
 
+import asyncio
 import csv
+import operator
+import os
+import shutil
 import sys
+import time
+from contextlib import nullcontext
 from pathlib import Path
-from time import sleep
+from typing import Dict, Iterator, List, Optional, Set, TextIO, Tuple
 
+import aiohttp
+
+from utils import cache
 from utils.colors import print_colored, print_progress_bar, Colors
 from csv_handler.parser import detect_delimiter, find_column_indices
+from utils.throttle import RateController
 from search.youtube import search_youtube
-from search.tmdb import get_director_popular_movies, format_related_films, test_tmdb_connection
+from search.tmdb import (
+    get_director_popular_movies, prefetch_director_movies, format_related_films, test_tmdb_connection
+)
+
+# Large buffers keep reads and writes in few syscalls on big catalogs
+BUFFER_SIZE = 1 << 20
+
+# Pooled keep-alive connections shared by all YouTube and TMDb requests. TMDb and Data
+# API responses are read in full and always reused; a scraped results page is abandoned
+# once the video ID is found, which closes its connection unless Content-Length
+# shows only a short remainder was left (see search.youtube.DRAIN_LIMIT)
+CONNECTION_LIMIT = 32
+DNS_CACHE_TTL = 300
+
+DEFAULT_CHECKPOINT_INTERVAL = 50
+
+# Each checkpoint rewrites the whole file, so never save more often than this
+CHECKPOINT_MIN_SECONDS = 5.0
+
+
+class _Checkpointer:
+    """
+    Periodically saves progress into the input file so an interrupted run can resume.
+    
+    Once ``interval`` rows have been filled in since the last checkpoint, and at
+    least ``min_seconds`` have passed, the input is atomically replaced by the rows
+    processed so far followed by the untouched remainder of the original. Rows that
+    were skipped don't count, so a rerun over a finished file never rewrites it.
+    Rows that already have their data are skipped on the next run.
+    """
+    
+    def __init__(self, input_file: str, temp_file: str, infile: TextIO, outfile: TextIO, interval: int,
+                 min_seconds: float = CHECKPOINT_MIN_SECONDS):
+        self.input_file = input_file
+        self.temp_file = temp_file
+        self.partial_file = input_file + ".partial"
+        self.infile = infile
+        self.outfile = outfile
+        self.interval = interval
+        self.min_seconds = min_seconds
+        self.enabled = interval > 0
+        self._offsets = {}
+        self._changed = 0
+        self._last_save = time.monotonic()
+        # Kept open so the original stays readable after the first checkpoint replaces it
+        self._source = open(input_file, "r", newline="", encoding="utf-8")
+    
+    def row_read(self, index: int) -> None:
+        """Remember where the original file continues after a possible checkpoint row"""
+        if self.enabled and (index + 1) % self.interval == 0:
+            self._offsets[index] = self.infile.tell()
+    
+    def row_written(self, index: int, changed: bool) -> None:
+        """Save a checkpoint once a full interval of changed rows has been written"""
+        if changed:
+            self._changed += 1
+        offset = self._offsets.pop(index, None)
+        if (offset is not None and self.enabled and self._changed >= self.interval
+                and time.monotonic() - self._last_save >= self.min_seconds):
+            self._save(offset)
+            self._changed = 0
+            self._last_save = time.monotonic()
+    
+    def _save(self, offset: int) -> None:
+        try:
+            self.outfile.flush()
+            with open(self.temp_file, "r", newline="", encoding="utf-8") as done, \
+                    open(self.partial_file, "w", newline="", encoding="utf-8", buffering=BUFFER_SIZE) as partial:
+                shutil.copyfileobj(done, partial, BUFFER_SIZE)
+                self._source.seek(offset)
+                shutil.copyfileobj(self._source, partial, BUFFER_SIZE)
+                partial.flush()
+                os.fsync(partial.fileno())
+            os.replace(self.partial_file, self.input_file)
+        except OSError as e:
+            # e.g. the input can't be replaced while open on Windows; keep processing
+            print_colored(f"\n⚠️  Checkpointing disabled: {e}", Colors.YELLOW)
+            self.enabled = False
+    
+    def close(self) -> None:
+        self._source.close()
+        if os.path.exists(self.partial_file):
+            os.remove(self.partial_file)
+
+
+def _scan_rows(input_file: str, delimiter: str, title_col: int, director_col: int, year_col: int,
+               related_films_col: Optional[int]) -> Tuple[int, Set[str]]:
+    """
+    First pass over the file: count data rows and collect the distinct directors
+    whose rows still need related films, without keeping rows in memory.
+    """
+    directors = set()
+    with open(input_file, "r", newline="", encoding="utf-8", buffering=BUFFER_SIZE) as infile:
+        reader = csv.reader(infile, delimiter=delimiter)
+        next(reader, None)
+        if related_films_col is None:
+            # Nothing to collect; let the C reader run without per-row Python work
+            return sum(1 for _ in reader), directors
+        
+        total_rows = 0
+        columns = (title_col, director_col, year_col, related_films_col)
+        width = max(columns) + 1
+        for row in reader:
+            total_rows += 1
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            if row[title_col] and row[director_col] and row[year_col] and not row[related_films_col].strip():
+                directors.add(row[director_col])
+    return total_rows, directors
+
+
+async def _process_rows(rows: Iterator[List[str]], writer, total_rows: int, title_col: int,
+                        director_col: int, year_col: int, trailer_col: int,
+                        related_films_col: Optional[int], related_directors: Set[str],
+                        delay: float = 2.0,
+                        concurrency: int = 5, max_rpm: int = 0, verbose: bool = False,
+                        dry_run: bool = False, include_related: bool = True,
+                        checkpointer: Optional[_Checkpointer] = None) -> Dict[str, int]:
+    """
+    Stream rows through concurrent workers and write them back in their original order.
+    
+    Rows are read lazily from ``rows`` into a bounded queue, so only a small window of
+    the file is held in memory. Finished rows wait in a reorder buffer until every
+    earlier row has been written to ``writer`` (which may be None for dry runs).
+    
+    All ``related_directors`` are looked up on TMDb concurrently before any row is
+    processed, so rows sharing a director fill their related films without another
+    round trip.
+    
+    If a ``checkpointer`` is given, it is told about every row read and written, and
+    whether it was changed, so it can periodically save progress.
+    """
+    stats = {"processed": 0, "skipped": 0, "found": 0, "related_found": 0}
+    # Concurrency adapts to provider responses; delay is the backoff when throttled
+    controller = RateController(concurrency=concurrency, backoff=delay, max_rpm=max_rpm)
+    
+    # Loop invariants, computed once per run instead of once per row
+    check_related = include_related and related_films_col is not None
+    max_col = max(title_col, director_col, year_col, trailer_col)
+    if check_related:
+        max_col = max(max_col, related_films_col)
+    # Repaint the progress bar at most ~200 times per run
+    progress_step = max(1, total_rows // 200)
+    last_painted = 0
+    # Projects the movie fields out of a row in one C-level call
+    movie_fields = operator.itemgetter(title_col, director_col, year_col)
+    
+    async def process_row(session: aiohttp.ClientSession, i: int, row: list) -> bool:
+        """Fill in the row's missing data, returning whether any cell was filled"""
+        nonlocal last_painted
+        changed = False
+        movie_title, movie_director, movie_year = movie_fields(row)
+        
+        if not (movie_title and movie_director and movie_year):
+            if verbose:
+                print_colored(f"  ⏭️  Skipping: Missing data in row {i+1}", Colors.YELLOW)
+            stats["skipped"] += 1
+            return False
+        
+        # Check what needs to be processed
+        needs_trailer = not row[trailer_col].strip()
+        needs_related = check_related and not row[related_films_col].strip()
+        
+        if not needs_trailer and not needs_related:
+            if verbose:
+                print_colored(f"  ⏭️  Skipping: {movie_title} (all data exists)", Colors.YELLOW)
+            stats["skipped"] += 1
+            return False
+        
+        async with controller:
+            if verbose:
+                tasks = []
+                if needs_trailer:
+                    tasks.append("trailer")
+                if needs_related:
+                    tasks.append("related films")
+                print_colored(f"  🎯 Processing: {movie_title} ({movie_year}) - {', '.join(tasks)}", Colors.BLUE)
+            
+            if not dry_run:
+                # Search for trailer if needed
+                if needs_trailer:
+                    year_int = int(movie_year)
+                    trailer_link = await search_youtube(
+                        session,
+                        f"{movie_title} +movie +trailer {movie_director} after:{year_int - 1}-01-01",
+                        verbose=verbose,
+                        controller=controller
+                    )
+                    if trailer_link:
+                        if verbose:
+                            print_colored(f"  ✅ Found trailer: {trailer_link}", Colors.GREEN)
+                        row[trailer_col] = trailer_link
+                        stats["found"] += 1
+                        changed = True
+                    else:
+                        row[trailer_col] = ""
+                
+                # Search for related films if needed
+                if needs_related:
+                    related_movies = await get_director_popular_movies(
+                        session,
+                        movie_director, 
+                        current_movie_title=movie_title,
+                        limit=3, 
+                        verbose=verbose,
+                        controller=controller
+                    )
+                    if related_movies:
+                        formatted_related = format_related_films(related_movies)
+                        row[related_films_col] = formatted_related
+                        stats["related_found"] += 1
+                        changed = True
+                        if verbose:
+                            print_colored(f"  🎬 Related films: {formatted_related}", Colors.GREEN)
+                    else:
+                        row[related_films_col] = ""
+        
+        stats["processed"] += 1
+        done = stats["processed"] + stats["skipped"]
+        if not verbose and done - last_painted >= progress_step:
+            print_progress_bar(done, total_rows)
+            last_painted = done
+        return changed
+    
+    workers = controller.semaphore.max_permits
+    queue = asyncio.Queue(maxsize=concurrency * 4)
+    # Bounds how far reading may run ahead of writing, and so the reorder buffer
+    window = asyncio.Semaphore(workers * 4)
+    finished = {}
+    next_to_write = 0
+    
+    def write_ready_rows() -> None:
+        nonlocal next_to_write
+        while next_to_write in finished:
+            row, changed = finished.pop(next_to_write)
+            if writer is not None:
+                writer.writerow(row)
+            if checkpointer is not None:
+                checkpointer.row_written(next_to_write, changed)
+            next_to_write += 1
+            window.release()
+    
+    async def produce() -> None:
+        for i, row in enumerate(rows):
+            if checkpointer is not None:
+                checkpointer.row_read(i)
+            # Pad short rows once at read time so workers can index cells directly
+            if len(row) <= max_col:
+                row.extend([""] * (max_col + 1 - len(row)))
+            await window.acquire()
+            await queue.put((i, row))
+        for _ in range(workers):
+            await queue.put(None)
+    
+    async def work(session: aiohttp.ClientSession) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            i, row = item
+            changed = await process_row(session, i, row)
+            finished[i] = (row, changed)
+            write_ready_rows()
+    
+    # One session per run so TCP+TLS connections are reused across rows where possible
+    connector = aiohttp.TCPConnector(limit=max(CONNECTION_LIMIT, workers), ttl_dns_cache=DNS_CACHE_TTL)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        if include_related and related_directors and not dry_run:
+            if verbose:
+                print_colored(f"  🎭 Looking up films for {len(related_directors)} directors", Colors.BLUE)
+            await prefetch_director_movies(session, related_directors, verbose=verbose, controller=controller)
+        
+        await asyncio.gather(produce(), *[work(session) for _ in range(workers)])
+    
+    # Skipped rows never paint, so bring a started bar to its final count
+    if not verbose and last_painted and last_painted < total_rows:
+        print_progress_bar(total_rows, total_rows)
+    
+    return stats
 
 
 def update_csv_with_trailers(input_file: str, delay: float = 2.0, verbose: bool = False, 
-                           dry_run: bool = False, force: bool = False, include_related: bool = True) -> None:
+                           dry_run: bool = False, force: bool = False, include_related: bool = True,
+                           concurrency: int = 5, max_rpm: int = 0, use_cache: bool = True,
+                           cache_file: Optional[str] = None,
+                           checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL) -> None:
     """Main function to update CSV with trailer links"""
     
     # Validate input file
@@ -23,16 +314,18 @@ def update_csv_with_trailers(input_file: str, delay: float = 2.0, verbose: bool
     if not input_file.lower().endswith('.csv'):
         print_colored(f"⚠️  Warning: '{input_file}' doesn't have .csv extension", Colors.YELLOW)
     
+    cache.configure(path=cache_file, enabled=use_cache)
+    
     print_colored(f"🎬 Movie Trailer Finder", Colors.BOLD)
     print_colored(f"📁 Processing file: {input_file}", Colors.BLUE)
     
-    # Test TMDb connection if related films are requested
+    # Check TMDb credentials if related films are requested
     if include_related:
         if test_tmdb_connection():
             if verbose:
-                print_colored(f"✅ TMDb API connection successful", Colors.GREEN)
+                print_colored(f"✅ TMDb credentials found", Colors.GREEN)
         else:
-            print_colored(f"⚠️  TMDb API unavailable - skipping related films", Colors.YELLOW)
+            print_colored(f"⚠️  TMDb API key or access token missing or invalid - skipping related films", Colors.YELLOW)
             include_related = False
     
     try:
@@ -41,12 +334,10 @@ def update_csv_with_trailers(input_file: str, delay: float = 2.0, verbose: bool
         if verbose:
             print_colored(f"📋 Detected delimiter: '{delimiter}'", Colors.BLUE)
         
-        # Read all rows first to modify in place
-        rows = []
+        # Only the header is needed up front; rows are streamed later
         with open(input_file, "r", newline="", encoding="utf-8") as infile:
             reader = csv.reader(infile, delimiter=delimiter)
             header = next(reader)
-            rows = list(reader)
         
         # Find column indices
         title_col, director_col, year_col, trailer_col, related_films_col = find_column_indices(header)
@@ -77,9 +368,6 @@ def update_csv_with_trailers(input_file: str, delay: float = 2.0, verbose: bool
             header.append("Trailer")
             trailer_col = len(header) - 1
             trailer_added = True
-            # Extend existing rows with empty trailer field
-            for row in rows:
-                row.append("")
         
         # Add related films column if it doesn't exist and TMDb is available
         related_films_added = False
@@ -93,9 +381,6 @@ def update_csv_with_trailers(input_file: str, delay: float = 2.0, verbose: bool
                 header.append("Related films")
                 related_films_col = len(header) - 1
                 related_films_added = True
-                # Extend existing rows with empty related films field
-                for row in rows:
-                    row.append("")
         
         # Display column mapping
         print_colored(f"📊 Column mapping:", Colors.GREEN)
@@ -108,100 +393,57 @@ def update_csv_with_trailers(input_file: str, delay: float = 2.0, verbose: bool
             print(f"  Related films: {header[related_films_col]} (column {related_films_col + 1})" + 
                   (" - NEW" if related_films_added else ""))
         
-        total_rows = len(rows)
-        processed = 0
-        skipped = 0
-        found = 0
-        related_found = 0
+        total_rows, related_directors = _scan_rows(
+            input_file, delimiter, title_col, director_col, year_col,
+            related_films_col if include_related else None
+        )
         
         print_colored(f"\n🔍 Processing {total_rows} movies...", Colors.BLUE)
         
-        for i, row in enumerate(rows):
-            # Ensure row has enough columns
-            max_col = max(title_col, director_col, year_col, trailer_col)
-            if include_related and related_films_col is not None:
-                max_col = max(max_col, related_films_col)
-            
-            while len(row) <= max_col:
-                row.append("")
-            
-            movie_title = row[title_col]
-            movie_director = row[director_col]
-            movie_year = row[year_col]
-            
-            if not movie_title or not movie_director or not movie_year:
-                if verbose:
-                    print_colored(f"  ⏭️  Skipping: Missing data in row {i+1}", Colors.YELLOW)
-                skipped += 1
-                continue
-            
-            # Check what needs to be processed
-            needs_trailer = not (row[trailer_col] and row[trailer_col].strip())
-            needs_related = (include_related and related_films_col is not None and 
-                           not (row[related_films_col] and row[related_films_col].strip()))
-            
-            if not needs_trailer and not needs_related:
-                if verbose:
-                    print_colored(f"  ⏭️  Skipping: {movie_title} (all data exists)", Colors.YELLOW)
-                skipped += 1
-                continue
-            
-            if verbose:
-                tasks = []
-                if needs_trailer:
-                    tasks.append("trailer")
-                if needs_related:
-                    tasks.append("related films")
-                print_colored(f"  🎯 Processing: {movie_title} ({movie_year}) - {', '.join(tasks)}", Colors.BLUE)
-            else:
-                print_progress_bar(i + 1, total_rows)
-
-            if not dry_run:
-                # Search for trailer if needed
-                if needs_trailer:
-                    trailer_link = search_youtube(
-                        f"{movie_title} +movie +trailer {movie_director} after:{int(movie_year) - 1}-01-01",
-                        verbose=verbose
-                    )
-                    if trailer_link:
-                        if verbose:
-                            print_colored(f"  ✅ Found trailer: {trailer_link}", Colors.GREEN)
-                        row[trailer_col] = trailer_link
-                        found += 1
-                    else:
-                        row[trailer_col] = ""
+        # Rows are written to a temporary file that replaces the input on success;
+        # until then the input only ever holds the original or the last checkpoint
+        temp_file = input_file + ".tmp"
+        checkpointer = None
+        try:
+            with open(input_file, "r", newline="", encoding="utf-8", buffering=BUFFER_SIZE) as infile, \
+                    (nullcontext() if dry_run else
+                     open(temp_file, "w", newline="", encoding="utf-8", buffering=BUFFER_SIZE)) as outfile:
+                # readline keeps infile.tell() usable for checkpoints
+                reader = csv.reader(iter(infile.readline, ""), delimiter=delimiter)
+                next(reader)  # header was read above
+                writer = None
+                if outfile is not None:
+                    writer = csv.writer(outfile, delimiter=delimiter)
+                    writer.writerow(header)
+                    if checkpoint_interval > 0:
+                        checkpointer = _Checkpointer(input_file, temp_file, infile, outfile, checkpoint_interval)
                 
-                # Search for related films if needed
-                if needs_related:
-                    related_movies = get_director_popular_movies(
-                        movie_director, 
-                        current_movie_title=movie_title,
-                        limit=3, 
-                        verbose=verbose
-                    )
-                    if related_movies:
-                        formatted_related = format_related_films(related_movies)
-                        row[related_films_col] = formatted_related
-                        related_found += 1
-                        if verbose:
-                            print_colored(f"  🎬 Related films: {formatted_related}", Colors.GREEN)
-                    else:
-                        row[related_films_col] = ""
-                
-                sleep(delay)
-            
-            processed += 1
+                try:
+                    stats = asyncio.run(_process_rows(
+                        reader, writer, total_rows, title_col, director_col, year_col, trailer_col,
+                        related_films_col, related_directors, delay=delay, concurrency=concurrency,
+                        max_rpm=max_rpm, verbose=verbose, dry_run=dry_run,
+                        include_related=include_related, checkpointer=checkpointer
+                    ))
+                finally:
+                    if checkpointer is not None:
+                        checkpointer.close()
+        except BaseException:
+            if not dry_run and os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        
+        if not dry_run:
+            os.replace(temp_file, input_file)
+        
+        processed = stats["processed"]
+        skipped = stats["skipped"]
+        found = stats["found"]
+        related_found = stats["related_found"]
         
         if not verbose:
             print()  # New line after progress bar
         
-        # Write back to file (unless dry run)
-        if not dry_run:
-            with open(input_file, "w", newline="", encoding="utf-8") as outfile:
-                writer = csv.writer(outfile, delimiter=delimiter)
-                writer.writerow(header)
-                writer.writerows(rows)
-        
         # Summary
         print_colored(f"\n📈 Summary:", Colors.BOLD)
         print(f"  Total movies: {total_rows}")
@@ -228,3 +470,5 @@ def update_csv_with_trailers(input_file: str, delay: float = 2.0, verbose: bool
     except Exception as e:
         print_colored(f"❌ Unexpected error: {e}", Colors.RED)
         sys.exit(1)
+    finally:
+        cache.close()
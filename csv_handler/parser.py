@@ -1,45 +1,59 @@
 """CSV parsing and column detection utilities."""
 
-import csv
+import re
 from typing import Optional, Tuple
 
 
+# Delimiters we recognise, in order of preference when counts tie
+CANDIDATE_DELIMITERS = [',', ';', '\t', '|']
+
+
 def detect_delimiter(file_path: str) -> str:
-    """Auto-detect CSV delimiter"""
+    """Auto-detect CSV delimiter from the header and the first non-blank data line"""
     with open(file_path, 'r', encoding='utf-8') as f:
-        sample = f.read(1024)
-        sniffer = csv.Sniffer()
-        try:
-            delimiter = sniffer.sniff(sample).delimiter
-            return delimiter
-        except:
-            # Fallback to semicolon if detection fails
-            return ';'
+        first_line = f.readline()
+        second_line = next((line for line in f if line.strip()), "")
+    
+    def score(delimiter: str) -> int:
+        # A real delimiter appears consistently on the header and the first row
+        if not second_line:
+            return first_line.count(delimiter)
+        return min(first_line.count(delimiter), second_line.count(delimiter))
+    
+    delimiter = max(CANDIDATE_DELIMITERS, key=score)
+    if score(delimiter) == 0:
+        # Fallback to semicolon if detection fails
+        return ';'
+    return delimiter
+
+
+# Keywords recognised for each column, in the order categories are tried
+COLUMN_KEYWORDS = {
+    "title": ['title', 'movie', 'film', 'name'],
+    "director": ['director', 'directed', 'filmmaker'],
+    "year": ['year', 'date', 'released'],
+    "trailer": ['trailer', 'link', 'url', 'video'],
+    "related": ['related', 'films', 'movies', 'other', 'similar'],
+}
+
+# One precompiled alternation per category replaces a Python-level keyword scan
+COLUMN_PATTERNS = {
+    category: re.compile("|".join(re.escape(keyword) for keyword in keywords))
+    for category, keywords in COLUMN_KEYWORDS.items()
+}
 
 
 def find_column_indices(header: list) -> Tuple[Optional[int], Optional[int], Optional[int], Optional[int], Optional[int]]:
     """Find column indices for title, director, year, trailer, and related films columns."""
-    title_col = director_col = year_col = trailer_col = related_films_col = None
-    
-    # More flexible column matching
-    title_keywords = ['title', 'movie', 'film', 'name']
-    director_keywords = ['director', 'directed', 'filmmaker']
-    year_keywords = ['year', 'date', 'released']
-    trailer_keywords = ['trailer', 'link', 'url', 'video']
-    related_keywords = ['related', 'films', 'movies', 'other', 'similar']
+    columns = dict.fromkeys(COLUMN_PATTERNS)
     
     for i, col_name in enumerate(header):
         col_lower = col_name.lower().strip()
         
-        if title_col is None and any(keyword in col_lower for keyword in title_keywords):
-            title_col = i
-        elif director_col is None and any(keyword in col_lower for keyword in director_keywords):
-            director_col = i
-        elif year_col is None and any(keyword in col_lower for keyword in year_keywords):
-            year_col = i
-        elif trailer_col is None and any(keyword in col_lower for keyword in trailer_keywords):
-            trailer_col = i
-        elif related_films_col is None and any(keyword in col_lower for keyword in related_keywords):
-            related_films_col = i
+        # Each column is assigned to the first still-unassigned category it matches
+        for category, pattern in COLUMN_PATTERNS.items():
+            if columns[category] is None and pattern.search(col_lower):
+                columns[category] = i
+                break
     
-    return title_col, director_col, year_col, trailer_col, related_films_col
+    return columns["title"], columns["director"], columns["year"], columns["trailer"], columns["related"]
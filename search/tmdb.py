@@ -1,22 +1,112 @@
-"""TMDb API integration for finding director's popular movies using tmdbv3api."""
+"""TMDb API integration for finding director's popular movies."""
 
+import asyncio
+import heapq
 import os
-from typing import List, Optional
+import re
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional
+
+import aiohttp
+import orjson
 from dotenv import load_dotenv
-from tmdbv3api import TMDb, Person
 
+from utils.cache import cached
 from utils.colors import print_colored, Colors
+from utils.throttle import RateController, fetch_with_retries
 
 # Load environment variables
 load_dotenv()
 
-# Initialize TMDb
-tmdb = TMDb()
-tmdb.api_key = os.getenv("TMDB_API_KEY")
-tmdb.language = 'en'
-tmdb.debug = False
+TMDB_API_URL = "https://api.themoviedb.org/3"
+TMDB_API_KEY = os.environ.get("TMDB_API_KEY")
+# v4 "API Read Access Token", sent as a Bearer token instead of the v3 key
+TMDB_V4_TOKEN = os.environ.get("TMDB_V4_TOKEN")
+TMDB_LANGUAGE = 'en'
+
+# Separators between co-directors: &, +, /, "and" and commas
+_SEP_RE = re.compile(r'\s*[&+/]\s*|\s+and\s+|\s*,\s*')
+
+# Most popular films kept per director; enough for any related-films limit we use
+MAX_DIRECTOR_MOVIES = 20
+
+# v3 API keys are 32 characters and v4 tokens much longer; anything shorter is a typo
+MIN_CREDENTIAL_LENGTH = 20
+
+# Checked once here rather than on every lookup
+_API_KEY_MISSING = not (TMDB_API_KEY or TMDB_V4_TOKEN)
+
+# Set once TMDb answers 401, so the remaining lookups fail fast instead of each retrying
+_credentials_rejected = False
+
+# Directors looked up at once by prefetch_director_movies when no rate controller is
+# given; each lookup is a search followed by a credits request, which keeps us within
+# TMDb's limit of roughly 40 requests per 10 seconds
+PREFETCH_CONCURRENCY = 10
+
+class TMDbLookupError(Exception):
+    """A TMDb lookup failed, as opposed to finding nothing"""
 
-person = Person()
+
+# In-flight and completed director lookups, keyed by normalized director name
+_director_lookups: Dict[str, "asyncio.Task[List[dict]]"] = {}
+
+
+def _reject_credentials() -> None:
+    """Stop TMDb lookups for this run after the credentials were refused"""
+    global _credentials_rejected
+    if not _credentials_rejected:
+        _credentials_rejected = True
+        print_colored("\n⚠️  TMDb rejected the API key or access token - skipping related films", Colors.YELLOW)
+
+
+async def _get_json(session: aiohttp.ClientSession, path: str, params: Optional[Dict[str, Any]] = None,
+                    controller: Optional[RateController] = None) -> Dict[str, Any]:
+    """
+    GET a TMDb endpoint and decode the JSON body.
+    
+    Transient failures are retried by fetch_with_retries. Raises
+    aiohttp.ClientError or asyncio.TimeoutError when the request still fails.
+    """
+    params = {"language": TMDB_LANGUAGE, **(params or {})}
+    headers = {}
+    if TMDB_V4_TOKEN:
+        headers["Authorization"] = f"Bearer {TMDB_V4_TOKEN}"
+    else:
+        params["api_key"] = TMDB_API_KEY
+    
+    async def read(response: aiohttp.ClientResponse) -> Dict[str, Any]:
+        if response.status == 401:
+            _reject_credentials()
+        response.raise_for_status()
+        return orjson.loads(await response.read())
+    
+    return await fetch_with_retries(
+        session, f"{TMDB_API_URL}{path}", read, controller,
+        params=params, headers=headers, timeout=aiohttp.ClientTimeout(total=10)
+    )
+
+
+def _normalize_name(name: Any) -> Any:
+    """Case- and whitespace-insensitive form of a name, for cache keys"""
+    return name.strip().casefold() if isinstance(name, str) else name
+
+
+def _matches_current(movie_key: str, current_title_key: str) -> bool:
+    """
+    Whether a normalized title looks like the current movie's normalized title.
+    
+    Substring matches only count between titles of similar length, so "A"
+    doesn't exclude "Apocalypse Now".
+    """
+    if not current_title_key:
+        return False
+    if movie_key == current_title_key:
+        return True
+    return (
+        0.5 < len(movie_key) / len(current_title_key) < 2 and
+        (current_title_key in movie_key or movie_key in current_title_key)
+    )
 
 
 def parse_multiple_directors(director_string: str) -> List[str]:
@@ -29,14 +119,12 @@ def parse_multiple_directors(director_string: str) -> List[str]:
     Returns:
         List of individual director names
     """
-    import re
-    
     if not director_string or not director_string.strip():
         return []
     
     # Replace common separators with commas for consistent splitting
     # Handle various formats: &, and, +, /
-    normalized = re.sub(r'\s*[&+/]\s*|\s+and\s+|\s*,\s*', ',', director_string.strip())
+    normalized = _SEP_RE.sub(',', director_string.strip())
     
     # Split by comma and clean up each name
     directors = []
@@ -48,207 +136,272 @@ def parse_multiple_directors(director_string: str) -> List[str]:
     return directors
 
 
-def search_single_director(director_name: str, limit: int = 3, verbose: bool = False) -> List[str]:
+@cached("tmdb-person", normalize=_normalize_name, cache_empty=True)
+async def _search_director(session: aiohttp.ClientSession, director_name: str,
+                           verbose: bool = False,
+                           controller: Optional[RateController] = None) -> Optional[dict]:
     """
-    Search for movies by a single director.
+    Find the TMDb person best matching a director's name.
     
     Args:
+        session: Shared HTTP session used for TMDb requests
         director_name: Name of a single director
-        limit: Number of movies to return
         verbose: Whether to show detailed output
+        controller: Rate controller notified of every TMDb response
         
     Returns:
-        List of movie titles
+        Dict with the person's "id" and "name", or None if not found
+        
+    Raises:
+        TMDbLookupError: If the search failed, so it isn't remembered as not found
     """
+    if verbose:
+        print_colored(f"    🔍 Searching for: {director_name}", Colors.BLUE)
+    
     try:
-        if verbose:
-            print_colored(f"    🔍 Searching for: {director_name}", Colors.BLUE)
-        
-        # Search for the director
-        try:
-            search_results = person.search(director_name)
-        except Exception as search_error:
-            if verbose:
-                print_colored(f"    ⚠️  Not found: {director_name}", Colors.YELLOW)
-            return []
-        
-        # Validate and safely access search results
-        try:
-            # Check if we have valid results
-            if not search_results:
-                if verbose:
-                    print_colored(f"    ⚠️  Not found: {director_name}", Colors.YELLOW)
-                return []
-            
-            # Try to get the length safely
-            try:
-                results_length = len(search_results)
-                if results_length == 0:
-                    if verbose:
-                        print_colored(f"    ⚠️  Not found: {director_name}", Colors.YELLOW)
-                    return []
-            except (TypeError, AttributeError):
-                # If we can't get length, try to access first element directly
-                pass
-            
-            # Get the first director result (most relevant)
-            director = search_results[0]
-            
-        except (IndexError, TypeError, AttributeError):
+        # Only the top match is used, so ask for the first page explicitly
+        data = await _get_json(session, "/search/person", {"query": director_name, "page": 1}, controller)
+        results = data.get("results") or []
+        if not results:
             if verbose:
                 print_colored(f"    ⚠️  Not found: {director_name}", Colors.YELLOW)
-            return []
-        
-        # Safely get director attributes with multiple fallback methods
-        director_id = None
-        director_display_name = director_name
-        
-        try:
-            # Try different ways to access the ID
-            if hasattr(director, 'id'):
-                director_id = director.id
-            elif hasattr(director, '__dict__') and 'id' in director.__dict__:
-                director_id = director.__dict__['id']
-            elif isinstance(director, dict) and 'id' in director:
-                director_id = director['id']
-            
-            # Try different ways to access the name
-            if hasattr(director, 'name'):
-                director_display_name = director.name
-            elif hasattr(director, '__dict__') and 'name' in director.__dict__:
-                director_display_name = director.__dict__['name']
-            elif isinstance(director, dict) and 'name' in director:
-                director_display_name = director['name']
-                
-        except Exception as e:
-            if verbose:
-                print_colored(f"    ❌ Error accessing director attributes for '{director_name}': {e}", Colors.RED)
-            return []
-        
-        if director_id is None:
-            if verbose:
-                print_colored(f"    ❌ No valid ID found for director: {director_name}", Colors.RED)
-            return []
+            return None
         
+        # The first result is the most relevant
+        director = results[0]
+        director_id = director["id"]
+        director_display_name = director.get("name") or director_name
+    except (KeyError, IndexError, TypeError, AttributeError, ValueError,
+            aiohttp.ClientError, asyncio.TimeoutError) as e:
         if verbose:
-            print_colored(f"    👤 Found: {director_display_name} (ID: {director_id})", Colors.GREEN)
-        
-        # Get director's movie credits
-        try:
-            credits = person.movie_credits(director_id)
-        except Exception as e:
-            if verbose:
-                print_colored(f"    ❌ Failed to get credits for '{director_display_name}': {e}", Colors.RED)
-            return []
-        
-        # Filter for directing credits and sort by popularity
-        directed_movies = []
-        
-        try:
-            crew_list = getattr(credits, 'crew', [])
-        except Exception:
-            crew_list = []
+            print_colored(f"    ❌ Error searching for '{director_name}': {e}", Colors.RED)
+        raise TMDbLookupError(director_name) from e
+    
+    if verbose:
+        print_colored(f"    👤 Found: {director_display_name} (ID: {director_id})", Colors.GREEN)
+    
+    return {"id": director_id, "name": director_display_name}
+
+
+@cached("tmdb-credits", cache_empty=True)
+async def _fetch_directed_movies(session: aiohttp.ClientSession, director_id: int,
+                                 verbose: bool = False,
+                                 controller: Optional[RateController] = None) -> List[dict]:
+    """
+    Fetch the most popular films directed by a TMDb person.
+    
+    Args:
+        session: Shared HTTP session used for TMDb requests
+        director_id: TMDb person ID of the director
+        verbose: Whether to show detailed output
+        controller: Rate controller notified of every TMDb response
         
-        for movie in crew_list:
-            try:
-                # Safely extract movie data
-                job = getattr(movie, 'job', '')
-                title = getattr(movie, 'title', '')
-                
-                if job == "Director" and title:
-                    directed_movies.append({
-                        "title": title,
-                        "popularity": getattr(movie, 'popularity', 0),
-                        "release_date": getattr(movie, 'release_date', ''),
-                        "vote_average": getattr(movie, 'vote_average', 0)
-                    })
-            except Exception:
-                # Skip movies with invalid data
-                continue
+    Returns:
+        Up to MAX_DIRECTOR_MOVIES movie dicts (title, popularity, release_date,
+        vote_average), most popular first
         
-        # Sort by popularity (descending) and take top results
-        directed_movies.sort(key=lambda x: x["popularity"], reverse=True)
-        top_movies = directed_movies[:limit]
+    Raises:
+        TMDbLookupError: If the credits couldn't be fetched or read
+    """
+    try:
+        # Get director's movie credits
+        credits = await _get_json(session, f"/person/{director_id}/movie_credits", controller=controller)
         
-        movie_titles = [movie["title"] for movie in top_movies]
+        # Filter for directing credits as (popularity, title, release_date, vote_average)
+        # tuples, which compare by popularity without a key function
+        directed = [
+            (movie.get("popularity") or 0, movie["title"],
+             movie.get("release_date") or "", movie.get("vote_average") or 0)
+            for movie in credits.get("crew") or []
+            if movie.get("job") == "Director" and movie.get("title")
+        ]
+        # Keep the most popular (top-k, no full sort)
+        top_movies = heapq.nlargest(MAX_DIRECTOR_MOVIES, directed)
+    except (KeyError, IndexError, TypeError, AttributeError, ValueError,
+            aiohttp.ClientError, asyncio.TimeoutError) as e:
+        if verbose:
+            print_colored(f"    ❌ Failed to get credits for person {director_id}: {e}", Colors.RED)
+        raise TMDbLookupError(director_id) from e
+    
+    # Only build dicts for the films kept, keeping cache entries small
+    return [
+        {"title": title, "popularity": popularity,
+         "release_date": release_date, "vote_average": vote_average}
+        for popularity, title, release_date, vote_average in top_movies
+    ]
+
+
+async def _fetch_director_movies(session: aiohttp.ClientSession, director_name: str,
+                                 verbose: bool = False,
+                                 controller: Optional[RateController] = None) -> List[dict]:
+    """
+    Fetch the most popular films directed by a single director from TMDb.
+    
+    Person searches are cached by normalized name and credits by person ID, so
+    different spellings of the same director share one credits lookup.
+    
+    Returns:
+        Up to MAX_DIRECTOR_MOVIES movie dicts, most popular first
         
-        if verbose and movie_titles:
-            print_colored(f"    🎬 Found {len(movie_titles)} films by {director_display_name}:", Colors.GREEN)
-            for i, movie in enumerate(top_movies, 1):
-                year = movie["release_date"][:4] if movie["release_date"] else "N/A"
-                rating = movie["vote_average"]
-                print(f"      {i}. {movie['title']} ({year}) - Rating: {rating}/10")
+    Raises:
+        TMDbLookupError: If a TMDb request failed
+    """
+    director = await _search_director(session, director_name, verbose, controller)
+    if not director:
+        return []
+    return await _fetch_directed_movies(session, director["id"], verbose, controller)
+
+
+async def _lookup_director(session: aiohttp.ClientSession, director_name: str,
+                           verbose: bool = False,
+                           controller: Optional[RateController] = None) -> List[dict]:
+    """
+    Return a director's films, sharing one lookup per normalized name.
+    
+    Definite answers, including "not found" and "no directing credits", are
+    remembered for the run; failed lookups are forgotten so a later row retries.
+    """
+    key = _normalize_name(director_name)
+    lookup = _director_lookups.get(key)
+    if lookup is None:
+        lookup = asyncio.ensure_future(_fetch_director_movies(session, director_name, verbose, controller))
+        _director_lookups[key] = lookup
+    
+    try:
+        return await lookup
+    except TMDbLookupError:
+        if _director_lookups.get(key) is lookup:
+            # Don't remember failures; the next row may succeed
+            del _director_lookups[key]
+        return []
+
+
+async def prefetch_director_movies(session: aiohttp.ClientSession, director_strings: Iterable[str],
+                                   verbose: bool = False,
+                                   controller: Optional[RateController] = None) -> int:
+    """
+    Look up every distinct director concurrently before rows are processed.
+    
+    Results land in the in-process lookup table, so later calls to
+    get_director_popular_movies for any of these directors need no network.
+    
+    Args:
+        session: Shared HTTP session used for TMDb requests
+        director_strings: Director cells, each possibly naming several directors
+        verbose: Whether to show detailed output
+        controller: Rate controller gating and notified of every TMDb request
         
-        return movie_titles
+    Returns:
+        Number of distinct directors looked up
+    """
+    if _API_KEY_MISSING or _credentials_rejected:
+        return 0
+    
+    names = {}
+    for director_string in director_strings:
+        for name in parse_multiple_directors(director_string):
+            names.setdefault(_normalize_name(name), name)
+    
+    # Without a rate controller, cap the directors in flight ourselves
+    gate = controller or asyncio.Semaphore(PREFETCH_CONCURRENCY)
+    
+    async def fetch(name: str) -> None:
+        async with gate:
+            await _lookup_director(session, name, verbose, controller)
+    
+    await asyncio.gather(*[fetch(name) for name in names.values()])
+    return len(names)
+
+
+async def search_single_director(session: aiohttp.ClientSession, director_name: str, limit: int = 3,
+                                 verbose: bool = False,
+                                 controller: Optional[RateController] = None) -> List[str]:
+    """
+    Search for movies by a single director.
+    
+    Lookups are memoized per normalized director name for the lifetime of the
+    process, and concurrent callers share the same in-flight request.
+    
+    Args:
+        session: Shared HTTP session used for TMDb requests
+        director_name: Name of a single director
+        limit: Number of movies to return
+        verbose: Whether to show detailed output
+        controller: Rate controller notified of every TMDb response
         
-    except Exception as e:
-        if verbose:
-            print_colored(f"    ❌ Error searching for '{director_name}': {e}", Colors.RED)
-        return []
+    Returns:
+        List of movie titles
+    """
+    directed_movies = await _lookup_director(session, director_name, verbose, controller)
+    top_movies = directed_movies[:limit]
+    movie_titles = [movie["title"] for movie in top_movies]
+    
+    if verbose and movie_titles:
+        print_colored(f"    🎬 Found {len(movie_titles)} films by {director_name}:", Colors.GREEN)
+        for i, movie in enumerate(top_movies, 1):
+            year = movie["release_date"][:4] if movie["release_date"] else "N/A"
+            rating = movie["vote_average"]
+            print(f"      {i}. {movie['title']} ({year}) - Rating: {rating}/10")
+    
+    return movie_titles
 
 
-def get_director_popular_movies(director_name: str, current_movie_title: str = "", limit: int = 3, verbose: bool = False) -> List[str]:
+async def get_director_popular_movies(session: aiohttp.ClientSession, director_name: str,
+                                      current_movie_title: str = "", limit: int = 3,
+                                      verbose: bool = False,
+                                      controller: Optional[RateController] = None) -> List[str]:
     """
     Get the most popular movies by director(s) from TMDb.
     Handles multiple directors separated by commas, &, or 'and'.
     
     Args:
+        session: Shared HTTP session used for TMDb requests
         director_name: Name(s) of the director(s) to search for
         current_movie_title: Title of the current movie to exclude from results
         limit: Number of movies to return (default: 3)
         verbose: Whether to show detailed output
+        controller: Rate controller notified of every TMDb response
         
     Returns:
         List of movie titles (up to limit, excluding current movie)
     """
-    if not tmdb.api_key:
+    if _API_KEY_MISSING or _credentials_rejected:
         if verbose:
-            print_colored("  ⚠️  TMDb API key not found in .env file", Colors.YELLOW)
+            print_colored("  ⚠️  TMDb API key or access token missing or rejected", Colors.YELLOW)
         return []
     
     try:
         if verbose:
             print_colored(f"  🔍 Processing director(s): {director_name}", Colors.BLUE)
         
-        # Parse multiple directors
-        directors = parse_multiple_directors(director_name)
+        # Parse multiple directors, dropping repeats that differ only in case or spacing
+        unique_directors = {}
+        for director in parse_multiple_directors(director_name):
+            unique_directors.setdefault(_normalize_name(director), director)
+        directors = list(unique_directors.values())
         
         if verbose and len(directors) > 1:
             print_colored(f"  👥 Found {len(directors)} directors: {', '.join(directors)}", Colors.BLUE)
         
-        # Collect movies from all directors
-        all_movies = []
+        # Collect movies from all directors, looking them up concurrently
         movies_per_director = max(1, limit // len(directors)) if len(directors) > 1 else limit
         
-        for director in directors:
-            director_movies = search_single_director(director, movies_per_director, verbose)
-            all_movies.extend(director_movies)
-        
-        # Remove duplicates and exclude current movie
-        seen = set()
-        unique_movies = []
-        current_title_lower = current_movie_title.lower().strip() if current_movie_title else ""
+        per_director_movies = await asyncio.gather(*[
+            search_single_director(session, director, movies_per_director, verbose, controller)
+            for director in directors
+        ])
         
-        for movie in all_movies:
-            movie_lower = movie.lower().strip()
-            
-            # Skip if already seen
-            if movie in seen:
-                continue
-                
-            # Skip if it matches the current movie (only if current_movie_title is provided)
-            if current_title_lower and (
-                movie_lower == current_title_lower or 
-                current_title_lower in movie_lower or 
-                movie_lower in current_title_lower
-            ):
-                continue
-                
-            seen.add(movie)
-            unique_movies.append(movie)
+        # Remove duplicates case-insensitively; the first (most popular) spelling wins
+        unique_movies = {}
+        for movie in chain.from_iterable(per_director_movies):
+            unique_movies.setdefault(_normalize_name(movie), movie)
         
-        # Return up to the requested limit
-        result = unique_movies[:limit]
+        # Exclude current movie and return up to the requested limit
+        current_title_key = _normalize_name(current_movie_title) if current_movie_title else ""
+        result = [
+            movie for movie_key, movie in unique_movies.items()
+            if not _matches_current(movie_key, current_title_key)
+        ][:limit]
         
         if verbose and current_movie_title:
             print_colored(f"  🚫 Excluded current movie: {current_movie_title}", Colors.YELLOW)
@@ -272,13 +425,11 @@ def format_related_films(movies: List[str]) -> str:
 
 
 def test_tmdb_connection() -> bool:
-    """Test if TMDb API is accessible with the current key."""
-    if not tmdb.api_key:
-        return False
+    """
+    Check that TMDb credentials are configured and well-formed.
     
-    try:
-        # Try a simple search to test the connection
-        test_results = person.search("Christopher Nolan")
-        return len(test_results) > 0
-    except:
-        return False
+    No request is made; credentials TMDb rejects are detected by the first real
+    lookup, after which related-film lookups are skipped for the rest of the run.
+    """
+    credential = TMDB_V4_TOKEN or TMDB_API_KEY
+    return bool(credential) and len(credential.strip()) >= MIN_CREDENTIAL_LENGTH
@@ -1,36 +1,193 @@
 """YouTube trailer search functionality."""
 
+import asyncio
+import os
 import re
-import requests
-from typing import Optional
+from typing import List, Optional, Tuple
 
+import aiohttp
+import orjson
+from dotenv import load_dotenv
+
+from utils.cache import cached
 from utils.colors import print_colored, Colors
+from utils.throttle import RateController, fetch_with_retries
 
+# Load environment variables
+load_dotenv()
 
-def search_youtube(query: str, verbose: bool = False) -> Optional[str]:
-    """Search YouTube for a trailer and return the first result URL"""
-    try:
-        search_url = f"https://www.youtube.com/results?search_query={query}"
-        headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/91.0.4472.124 Safari/537.36"
-            )
-        }
-        response = requests.get(search_url, headers=headers, timeout=10)
+# Optional YouTube Data API key; without it the search results page is scraped
+YOUTUBE_API_KEY = os.environ.get("YOUTUBE_API_KEY")
+YOUTUBE_API_URL = "https://www.googleapis.com/youtube/v3/search"
+
+# Responses meaning the key is invalid (400 keyInvalid) or refused / out of quota (403)
+API_KEY_ERROR_STATUSES = {400, 403}
+
+# Set once the API answers with one of those, so later rows go straight to the page
+_api_disabled = False
+
+# Results-page date operator, sent to the API as publishedAfter instead of search text
+_AFTER_RE = re.compile(r"\s*\bafter:(\d{4}-\d{2}-\d{2})\b")
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/91.0.4472.124 Safari/537.36"
+)
+
+# Matched against the raw response bytes, so the page is never decoded as a whole
+_VIDEO_ID_RE = re.compile(rb"watch\?v=(\S{11})")
+
+# Longest possible match, so chunk boundaries never split one unseen
+_VIDEO_ID_MATCH_LEN = len(b"watch?v=") + 11
+
+READ_CHUNK_SIZE = 16384
+
+# Leaving a response unread makes aiohttp close its connection rather than pool it.
+# When Content-Length shows at most this much is left, it is read out so the
+# connection can be reused; otherwise a fresh TCP+TLS handshake is cheaper than
+# downloading the rest of the page
+DRAIN_LIMIT = 64 * 1024
+
+
+async def _find_first_video_id(response: aiohttp.ClientResponse) -> Tuple[Optional[str], int]:
+    """
+    Read the page chunk by chunk and stop as soon as a video ID appears.
+    
+    Returns the video ID (or None) and the number of body bytes read.
+    """
+    tail = b""
+    consumed = 0
+    async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+        consumed += len(chunk)
+        # Carry over just enough bytes to catch a match split across chunks
+        window = tail + chunk
+        match = _VIDEO_ID_RE.search(window)
+        if match:
+            return match.group(1).decode("utf-8", "replace"), consumed
+        tail = window[-(_VIDEO_ID_MATCH_LEN - 1):]
+    return None, consumed
+
+
+async def _drain(response: aiohttp.ClientResponse, consumed: int) -> None:
+    """Read out the rest of a body known to be short, so the connection returns to the pool"""
+    length = response.content_length
+    if length is None or length - consumed > DRAIN_LIMIT:
+        # Unknown or long remainder: release now and let aiohttp close the connection
+        return
+    await response.content.read()
+
+
+async def _search_api(session: aiohttp.ClientSession, query: str,
+                      controller: Optional[RateController] = None) -> Optional[str]:
+    """
+    Find the first video for a query through the YouTube Data API.
+    
+    The query is written for the results page: '+' reads as a space and an
+    ``after:YYYY-MM-DD`` operator becomes the ``publishedAfter`` parameter.
+    
+    Raises aiohttp.ClientError or asyncio.TimeoutError when the request fails,
+    and ValueError or AttributeError when the response isn't the expected JSON.
+    """
+    params = {"part": "id", "type": "video", "maxResults": 1, "key": YOUTUBE_API_KEY}
+    after = _AFTER_RE.search(query)
+    if after:
+        params["publishedAfter"] = f"{after.group(1)}T00:00:00Z"
+        query = _AFTER_RE.sub("", query)
+    params["q"] = " ".join(query.replace("+", " ").split())
+    
+    async def read(response: aiohttp.ClientResponse) -> dict:
+        global _api_disabled
+        if response.status in API_KEY_ERROR_STATUSES:
+            _api_disabled = True
         response.raise_for_status()
+        return orjson.loads(await response.read())
+    
+    data = await fetch_with_retries(
+        session, YOUTUBE_API_URL, read, controller,
+        params=params, timeout=aiohttp.ClientTimeout(total=10)
+    )
+    
+    for item in data.get("items") or []:
+        video_id = (item.get("id") or {}).get("videoId")
+        if video_id:
+            return video_id
+    return None
 
-        # Use regex to find video IDs
-        video_ids = re.findall(r"watch\?v=(\S{11})", response.text)
 
-        if video_ids:
-            return f"https://www.youtube.com/watch?v={video_ids[0]}"
-        else:
+async def _search_page(session: aiohttp.ClientSession, query: str, verbose: bool = False,
+                       controller: Optional[RateController] = None) -> Optional[str]:
+    """Scrape the YouTube search results page for the first video ID"""
+    
+    async def read(response: aiohttp.ClientResponse) -> Optional[str]:
+        if response.status != 200:
             if verbose:
-                print_colored(f"  ⚠️  No video IDs found for query: {query}", Colors.YELLOW)
+                print_colored(f"  ❌ Error searching for '{query}': HTTP {response.status}", Colors.RED)
             return None
-    except requests.RequestException as e:
+        video_id, consumed = await _find_first_video_id(response)
+        if video_id:
+            await _drain(response, consumed)
+        elif verbose:
+            print_colored(f"  ⚠️  No video IDs found for query: {query}", Colors.YELLOW)
+        return video_id
+    
+    try:
+        return await fetch_with_retries(
+            session, f"https://www.youtube.com/results?search_query={query}", read, controller,
+            headers={"User-Agent": USER_AGENT}, timeout=aiohttp.ClientTimeout(total=10)
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         if verbose:
             print_colored(f"  ❌ Error searching for '{query}': {e}", Colors.RED)
     return None
+
+
+@cached("yt")
+async def search_youtube(session: aiohttp.ClientSession, query: str, verbose: bool = False,
+                         controller: Optional[RateController] = None) -> Optional[str]:
+    """
+    Search YouTube for a trailer and return the first result URL.
+    
+    Uses the YouTube Data API when YOUTUBE_API_KEY is set, and falls back to
+    scraping the search results page when it is not or the API request fails.
+    """
+    video_id = None
+    if YOUTUBE_API_KEY and not _api_disabled:
+        try:
+            video_id = await _search_api(session, query, controller)
+            if not video_id and verbose:
+                print_colored(f"  ⚠️  No videos found for query: {query}", Colors.YELLOW)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, AttributeError) as e:
+            # ValueError and AttributeError: a 200 that isn't API JSON, e.g. from a proxy
+            if verbose:
+                # Response errors quote the request URL, which includes the API key
+                reason = f"HTTP {e.status}" if isinstance(e, aiohttp.ClientResponseError) else e
+                print_colored(f"  ⚠️  YouTube Data API failed for '{query}': {reason} - searching the page instead", Colors.YELLOW)
+            video_id = await _search_page(session, query, verbose, controller)
+    else:
+        video_id = await _search_page(session, query, verbose, controller)
+    
+    return f"https://www.youtube.com/watch?v={video_id}" if video_id else None
+
+
+async def search_youtube_many(queries: List[str], session: Optional[aiohttp.ClientSession] = None,
+                              concurrency: int = 8, verbose: bool = False,
+                              controller: Optional[RateController] = None) -> List[Optional[str]]:
+    """
+    Search YouTube for several trailers concurrently.
+    
+    Results are returned in the same order as ``queries``. A session with a
+    per-host connection limit is created when none is passed in.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def search(active_session: aiohttp.ClientSession, query: str) -> Optional[str]:
+        async with semaphore:
+            return await search_youtube(active_session, query, verbose=verbose, controller=controller)
+    
+    if session is not None:
+        return list(await asyncio.gather(*[search(session, query) for query in queries]))
+    
+    connector = aiohttp.TCPConnector(limit_per_host=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as own_session:
+        return list(await asyncio.gather(*[search(own_session, query) for query in queries]))
@@ -0,0 +1,127 @@
+"""Persistent SQLite cache for YouTube and TMDb lookups."""
+
+import functools
+import hashlib
+import inspect
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import orjson
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "movie-trailer-finder" / "cache.db"
+
+# Arguments that don't change the result of a lookup
+IGNORED_ARGS = {"session", "verbose", "controller"}
+
+_connection: Optional[sqlite3.Connection] = None
+_cache_path = Path(os.environ.get("MOVIE_CACHE_PATH", DEFAULT_CACHE_PATH))
+_enabled = True
+
+# Distinguishes a cache miss from a cached None
+_MISSING = object()
+
+
+def configure(path: Optional[str] = None, enabled: bool = True) -> None:
+    """Set the cache location or disable caching for this run"""
+    global _cache_path, _enabled
+    close()
+    if path:
+        _cache_path = Path(path)
+    _enabled = enabled
+
+
+def close() -> None:
+    """Close the cache database if it is open"""
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+
+
+def _get_connection() -> sqlite3.Connection:
+    global _connection
+    if _connection is None:
+        _cache_path.parent.mkdir(parents=True, exist_ok=True)
+        _connection = sqlite3.connect(str(_cache_path))
+        # WAL lets reads proceed while another writer holds the database
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, ts INTEGER)"
+        )
+        # Replacing only overwrites matching keys, so prune expired rows once per run
+        _connection.execute("DELETE FROM cache WHERE ts <= ?", (int(time.time()) - DEFAULT_TTL,))
+        _connection.commit()
+    return _connection
+
+
+def make_key(namespace: str, *parts: Any) -> str:
+    """Build a cache key from a namespace and the lookup arguments"""
+    raw = f"{namespace}:" + "|".join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def lookup(key: str, ttl: int = DEFAULT_TTL, default: Any = None) -> Any:
+    """Return the cached value for key, or ``default`` if missing or expired"""
+    try:
+        row = _get_connection().execute(
+            "SELECT value FROM cache WHERE key=? AND ts>?", (key, int(time.time()) - ttl)
+        ).fetchone()
+    except (sqlite3.Error, OSError):
+        return default
+    return orjson.loads(row[0]) if row else default
+
+
+def store(key: str, value: Any) -> None:
+    """Store a JSON-serializable value under key"""
+    try:
+        connection = _get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, ts) VALUES (?, ?, ?)",
+            (key, orjson.dumps(value).decode("utf-8"), int(time.time()))
+        )
+        connection.commit()
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def cached(namespace: str, ttl: int = DEFAULT_TTL, normalize: Optional[Callable[[Any], Any]] = None,
+           cache_empty: bool = False) -> Callable:
+    """
+    Cache the results of an async lookup function on disk.
+
+    The key is built from the function's arguments, excluding the HTTP session,
+    rate controller and verbosity flag, each passed through ``normalize`` if
+    given. Empty results are not cached so that failed lookups are retried on
+    the next run, unless ``cache_empty`` is set for functions that raise on
+    failure, so an empty result is a definite answer. Exceptions are never cached.
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not _enabled:
+                return await func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            parts = [value for name, value in bound.arguments.items() if name not in IGNORED_ARGS]
+            if normalize is not None:
+                parts = [normalize(part) for part in parts]
+            key = make_key(namespace, *parts)
+
+            value = lookup(key, ttl, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            value = await func(*args, **kwargs)
+            if value or cache_empty:
+                store(key, value)
+            return value
+
+        return wrapper
+    return decorator
@@ -1,5 +1,8 @@
 """Terminal color utilities and output formatting."""
 
+import sys
+
+
 class Colors:
     """ANSI color codes for terminal output"""
     BLUE = '\033[94m'
@@ -10,14 +13,39 @@ class Colors:
     END = '\033[0m'
 
 
+# Skip ANSI codes entirely when output goes to a file or CI log
+_USE_COLOR = sys.stdout.isatty()
+
+
 def print_colored(text: str, color: str = Colors.END) -> None:
-    """Print colored text to terminal"""
+    """Print colored text to terminal, or plain text when stdout is not a terminal"""
+    if not _USE_COLOR:
+        print(text)
+        return
     print(f"{color}{text}{Colors.END}")
 
 
-def print_progress_bar(current: int, total: int, width: int = 50) -> None:
-    """Print a progress bar"""
+BAR_WIDTH = 50
+
+# Filled part of the bar, sliced to length instead of rebuilt on every update
+_FULL = '█' * BAR_WIDTH
+
+# Last integer percentage painted, so repeated updates within one percent are skipped
+_last_pct = -1
+
+
+def print_progress_bar(current: int, total: int, width: int = BAR_WIDTH) -> None:
+    """Print a progress bar, repainting only when the integer percentage changes"""
+    global _last_pct
     percent = current / total
+    pct = int(100 * percent)
+    if pct == _last_pct and current != total:
+        return
+    _last_pct = pct
+    
     filled = int(width * percent)
-    bar = '█' * filled + '░' * (width - filled)
-    print(f"\r{Colors.BLUE}Progress: [{bar}] {current}/{total} ({percent:.1%}){Colors.END}", end='', flush=True)
+    full = _FULL[:filled] if filled <= BAR_WIDTH else '█' * filled
+    bar = full.ljust(width, '░')
+    line = f"\rProgress: [{bar}] {current}/{total} ({percent:.1%})"
+    sys.stdout.write(f"{Colors.BLUE}{line}{Colors.END}" if _USE_COLOR else line)
+    sys.stdout.flush()
@@ -0,0 +1,249 @@
+"""Adaptive concurrency control for YouTube and TMDb requests."""
+
+import asyncio
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Mapping, Optional, TypeVar
+
+import aiohttp
+
+# Responses that mean the provider wants us to slow down
+THROTTLE_STATUSES = {429, 503}
+
+# Status recorded when a request timed out without a response
+TIMEOUT_STATUS = 0
+
+# Transient failures worth retrying: throttling, server errors and dropped connections
+RETRY_STATUSES = THROTTLE_STATUSES | {500, 502, 504}
+
+# Retries for transient failures, with exponential backoff starting at RETRY_BACKOFF seconds
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.3
+MAX_BACKOFF = 30.0
+
+# Throttled requests are resent this many times; with the circuit breaker's cooldown
+# that covers several minutes of sustained rate limiting
+MAX_THROTTLE_RETRIES = 10
+
+T = TypeVar("T")
+
+
+class DynamicSemaphore:
+    """Semaphore whose number of permits can change while it is in use"""
+
+    def __init__(self, permits: float, min_permits: int = 1, max_permits: Optional[int] = None):
+        self.min_permits = min_permits
+        self.max_permits = max_permits
+        self._permits = float(permits)
+        self._in_use = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def permits(self) -> int:
+        """Number of tasks currently allowed to hold the semaphore"""
+        return max(self.min_permits, int(self._permits))
+
+    def resize(self, permits: float) -> None:
+        """Set a new (fractional) permit count, clamped to the configured bounds"""
+        if self.max_permits is not None:
+            permits = min(permits, self.max_permits)
+        self._permits = max(float(self.min_permits), permits)
+
+    def grow(self, amount: float) -> None:
+        self.resize(self._permits + amount)
+
+    def shrink(self, factor: float) -> None:
+        self.resize(self._permits * factor)
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_use < self.permits)
+            self._in_use += 1
+
+    async def release(self) -> None:
+        async with self._condition:
+            self._in_use -= 1
+            self._condition.notify_all()
+
+    async def __aenter__(self) -> "DynamicSemaphore":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.release()
+
+
+class RateController:
+    """
+    AIMD concurrency controller with header-based pausing and a circuit breaker.
+
+    Every HTTP response is reported through ``record``. Fast, successful responses
+    additively grow the permit count by ``alpha``; throttling responses (429/503) and
+    timeouts multiply it by ``beta`` and pause all requests, honouring ``Retry-After``
+    and ``x-ratelimit-*`` headers when the provider sends them. After
+    ``breaker_threshold`` consecutive throttles the breaker opens and requests are
+    held for ``breaker_cooldown`` seconds. An optional sliding-window RPM limit keeps
+    us under a known quota before the provider has to push back.
+    """
+
+    def __init__(self, concurrency: int = 5, max_concurrency: Optional[int] = None,
+                 target_latency: float = 2.0, alpha: float = 0.5, beta: float = 0.5,
+                 backoff: float = 2.0, max_rpm: int = 0, breaker_threshold: int = 5,
+                 breaker_cooldown: float = 30.0):
+        self.semaphore = DynamicSemaphore(
+            concurrency, max_permits=max_concurrency if max_concurrency else concurrency * 4
+        )
+        self.target_latency = target_latency
+        self.alpha = alpha
+        self.beta = beta
+        self.backoff = backoff
+        self.max_rpm = max_rpm
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+        self._request_times = deque()
+
+    async def __aenter__(self) -> "RateController":
+        await self.semaphore.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.semaphore.release()
+
+    def record(self, status: int, latency: float, headers: Optional[Mapping[str, str]] = None) -> None:
+        """Adjust concurrency from the outcome of one request"""
+        now = time.monotonic()
+        headers = headers or {}
+
+        if status in THROTTLE_STATUSES or status == TIMEOUT_STATUS:
+            # Multiplicative decrease
+            self.semaphore.shrink(self.beta)
+            self._consecutive_throttles += 1
+            pause = _parse_retry_after(headers.get("Retry-After"))
+            if pause is None:
+                pause = self.backoff * self._consecutive_throttles
+            if self._consecutive_throttles >= self.breaker_threshold:
+                pause = max(pause, self.breaker_cooldown)
+            self._pause(now + pause)
+            return
+
+        self._consecutive_throttles = 0
+        if status < 400 and latency <= self.target_latency:
+            # Additive increase
+            self.semaphore.grow(self.alpha)
+
+        # Pause proactively once the provider reports an exhausted quota
+        remaining = _first_header(headers, "x-ratelimit-remaining", "x-ratelimit-remaining-requests")
+        if remaining is not None and remaining <= 0:
+            reset = _first_header(headers, "x-ratelimit-reset", "x-ratelimit-reset-requests")
+            if reset is not None:
+                # Providers send either an epoch timestamp or seconds until reset
+                reset_in = reset - time.time() if reset > 1e9 else reset
+                self._pause(now + max(0.0, reset_in))
+            else:
+                self._pause(now + self.backoff)
+
+    async def wait_if_throttled(self) -> None:
+        """Sleep while paused or while the sliding-window RPM limit is reached"""
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            if self.max_rpm:
+                window_start = now - 60.0
+                while self._request_times and self._request_times[0] <= window_start:
+                    self._request_times.popleft()
+                if len(self._request_times) >= self.max_rpm:
+                    await asyncio.sleep(self._request_times[0] - window_start)
+                    continue
+                self._request_times.append(now)
+            return
+
+    def _pause(self, until: float) -> None:
+        self._paused_until = max(self._paused_until, until)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _first_header(headers: Mapping[str, str], *names: str) -> Optional[float]:
+    """Return the first of the given headers that holds a number"""
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except ValueError:
+            continue
+    return None
+
+
+async def fetch_with_retries(session: aiohttp.ClientSession, url: str,
+                             read: Callable[[aiohttp.ClientResponse], Awaitable[T]],
+                             controller: Optional[RateController] = None,
+                             max_retries: int = MAX_RETRIES,
+                             max_throttle_retries: int = MAX_THROTTLE_RETRIES, **kwargs) -> T:
+    """
+    GET ``url`` and return ``await read(response)``, retrying transient failures.
+    
+    Each attempt waits on and reports to ``controller``. Throttled responses are
+    sent again once the controller's pause is over, up to ``max_throttle_retries``
+    times, so a rate limit delays a lookup instead of dropping it. Server errors,
+    dropped connections and timeouts are retried up to ``max_retries`` times with
+    exponential backoff. After that the response is handed to ``read`` whatever
+    its status. Extra keyword arguments go to ``session.get``. Raises
+    aiohttp.ClientError or asyncio.TimeoutError when the last attempt fails.
+    """
+    failures = 0
+    throttles = 0
+    while True:
+        if controller:
+            await controller.wait_if_throttled()
+        
+        started = time.monotonic()
+        try:
+            async with session.get(url, **kwargs) as response:
+                if controller:
+                    controller.record(response.status, time.monotonic() - started, response.headers)
+                if response.status in THROTTLE_STATUSES and throttles < max_throttle_retries:
+                    throttles += 1
+                    if controller:
+                        # The controller has paused; wait_if_throttled decides when to resend
+                        continue
+                    retries = throttles
+                elif response.status in RETRY_STATUSES and failures < max_retries:
+                    failures += 1
+                    retries = failures
+                else:
+                    return await read(response)
+        except asyncio.TimeoutError:
+            if controller:
+                controller.record(TIMEOUT_STATUS, time.monotonic() - started)
+            if failures == max_retries:
+                raise
+            failures += 1
+            retries = failures
+        except aiohttp.ClientConnectionError:
+            if failures == max_retries:
+                raise
+            failures += 1
+            retries = failures
+        
+        # Exponential backoff before retrying a transient failure
+        await asyncio.sleep(min(RETRY_BACKOFF * 2 ** (retries - 1), MAX_BACKOFF))